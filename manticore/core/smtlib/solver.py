@@ -16,9 +16,11 @@
 import os
 import threading
 import collections
+from contextlib import contextmanager
+import hashlib
 import shlex
 import time
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 from subprocess import PIPE, Popen
 import re
 from . import operators as Operators
@@ -138,6 +140,80 @@ class Solver(SingletonMixin):
 Version = collections.namedtuple("Version", "major minor patch")
 
 
+class SolverSession:
+    """
+    A solver process loaded with a fixed set of constraints. The constraints are sent once, on the first symbolic
+    query, and each query then only sends its own expression inside a push/pop scope, so a long series of queries
+    under the same constraints does not resend them every time.
+    Obtained with `Z3Solver.incremental()`, and only valid inside that context. Other queries may be issued to the
+    solver meanwhile: they reset it, which makes the session load its constraints again on its next query.
+    """
+
+    def __init__(self, solver, constraints):
+        self._solver = solver
+        self.constraints = constraints
+        self._smtlib = None
+        self._fingerprint = None
+        self._declared = None
+        self._feasible = None
+
+    @property
+    def smtlib(self):
+        """The SMTLIB text of the session constraints, translated on first use"""
+        if self._smtlib is None:
+            self._smtlib = self.constraints.to_string()
+        return self._smtlib
+
+    @property
+    def fingerprint(self) -> bytes:
+        """
+        A 16 byte blake2b digest of the SMTLIB text of each session constraint, without bindings. Unlike `smtlib`,
+        it is the same for two separately built sets holding the same constraints, so it can key caches across
+        sessions.
+        """
+        if self._fingerprint is None:
+            digest = hashlib.blake2b(digest_size=16)
+            for constraint in self.constraints.constraints:
+                digest.update(translate_to_smtlib(constraint).encode())
+                digest.update(b"\0")
+            self._fingerprint = digest.digest()
+        return self._fingerprint
+
+    def _load(self):
+        """Sends the constraints to the solver on the first query that needs them"""
+        if self._feasible is None:
+            self._declared = {var.name for var in self.constraints.declarations}
+            self._solver._reset(self.smtlib)
+            self._feasible = self._solver._is_sat()
+        return self._feasible
+
+    def can_be_true(self, expression=True) -> bool:
+        """Check if given expression could be valid under the session constraints"""
+        if not self._load():
+            return False
+        if not issymbolic(expression):
+            return bool(expression)
+        assert isinstance(expression, Bool)
+        self._solver._push()
+        try:
+            for var in get_variables(expression):
+                if var.name not in self._declared:
+                    self._solver._send(var.declaration)
+            self._solver._assert(expression)
+            return self._solver._is_sat()
+        finally:
+            self._solver._pop()
+
+    def must_be_true(self, expression) -> bool:
+        """
+        Check if expression is True and that it can not be False under the session constraints. It holds vacuously
+        when the constraints are unsatisfiable.
+        """
+        if not issymbolic(expression):
+            return bool(expression)
+        return not self.can_be_true(Operators.NOT(expression))
+
+
 class Z3Solver(Solver):
     def __init__(self):
         """
@@ -147,6 +223,8 @@ class Z3Solver(Solver):
         """
         super().__init__()
         self._proc: Popen = None
+        # The session opened by `incremental()`, whose loaded constraints any reset drops
+        self._session: Optional[SolverSession] = None
 
         self._command = (
             f"{consts.z3_bin} -t:{consts.timeout*1000} -memory:{consts.memory} -smt2 -in"
@@ -275,6 +353,8 @@ class Z3Solver(Solver):
 
     def _reset(self, constraints=None):
         """Auxiliary method to reset the smtlib external solver to initial defaults"""
+        if self._session is not None:
+            self._session._feasible = None
         if self._proc is None:
             self._start_proc()
         else:
@@ -398,6 +478,25 @@ class Z3Solver(Solver):
         """Recall the last pushed constraint store and state."""
         self._send("(pop 1)")
 
+    @contextmanager
+    def incremental(self, constraints):
+        """
+        Loads `constraints` into the solver once and yields a `SolverSession` to run queries against them.
+        Any other query issued to this solver while the session is open resets it, and the session then loads its
+        constraints again on its next query.
+
+        :param constraints: the constraints shared by all the queries of the session
+        """
+        session = SolverSession(self, constraints)
+        previous, self._session = self._session, session
+        try:
+            yield session
+        finally:
+            self._session = previous
+            if previous is not None:
+                # the inner session may have replaced the constraints of the outer one
+                previous._feasible = None
+
     def can_be_true(self, constraints, expression=True):
         """Check if two potentially symbolic values can be equal"""
         if isinstance(expression, bool):
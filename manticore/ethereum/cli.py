@@ -1,3 +1,5 @@
+from typing import Dict, Optional
+
 from .detectors import (
     DetectInvalid,
     DetectIntegerOverflow,
@@ -23,6 +25,9 @@ from ..utils import config
 consts = config.get_group("cli")
 consts.add("profile", default=False, description="Enable worker profiling mode")
 
+# Detector classes by their command line argument, see `choose_detectors`
+_DETECTORS_BY_ARG: Optional[Dict[str, type]] = None
+
 
 def get_detectors_classes():
     return [
@@ -43,10 +48,15 @@ def get_detectors_classes():
     ]
 
 
+def _detectors_by_argument():
+    global _DETECTORS_BY_ARG
+    if _DETECTORS_BY_ARG is None:
+        _DETECTORS_BY_ARG = {d.ARGUMENT: d for d in get_detectors_classes()}
+    return _DETECTORS_BY_ARG
+
+
 def choose_detectors(args):
-    all_detector_classes = get_detectors_classes()
-    detectors = {d.ARGUMENT: d for d in all_detector_classes}
-    arguments = list(detectors.keys())
+    detectors = _detectors_by_argument()
 
     detectors_to_run = []
 
@@ -57,9 +67,9 @@ def choose_detectors(args):
             exclude = args.detectors_to_exclude.split(",")
 
             for e in exclude:
-                if e not in arguments:
+                if e not in detectors:
                     raise Exception(
-                        f"{e} is not a detector name, must be one of {arguments}. See also `--list-detectors`."
+                        f"{e} is not a detector name, must be one of {list(detectors)}. See also `--list-detectors`."
                     )
 
         for arg, detector_cls in detectors.items():
@@ -16,10 +16,14 @@ from ..utils.helpers import interval_intersection
 from ..utils import config
 
 import functools
+import hashlib
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Stored as a map content digest once the map is known to hold symbolic bytes
+_SYMBOLIC_CONTENT = object()
+
 consts = config.get_group("native")
 consts.add(
     "fast_crash",
@@ -131,6 +135,7 @@ class Map(object, metaclass=ABCMeta):
         self._end = start + size
         self._set_perms(perms)
         self._name = name
+        self._content_digest = None
 
     def _get_perms(self):
         """ Gets the access permissions of the map. """
@@ -210,6 +215,30 @@ class Map(object, metaclass=ABCMeta):
     def __hash__(self):
         return object.__hash__(self)
 
+    def _content_hash(self):
+        """
+        Returns a digest of the concrete contents of the map. It is computed on
+        first use and dropped on every write to the map.
+
+        :return: a 16 byte blake2b digest, or None if the map holds symbolic bytes
+        """
+        if self._content_digest is None:
+            data = self._concrete_content()
+            if data is None:
+                self._content_digest = _SYMBOLIC_CONTENT
+            else:
+                self._content_digest = hashlib.blake2b(data, digest_size=16).digest()
+        if self._content_digest is _SYMBOLIC_CONTENT:
+            return None
+        return self._content_digest
+
+    def _concrete_content(self):
+        """ Returns the contents of the map as bytes, or None if any of them is symbolic """
+        data = self[self.start : self.end]
+        if any(issymbolic(c) for c in data):
+            return None
+        return b"".join(data)
+
     def _in_range(self, index):
         """ Returns True if index is in range """
         if isinstance(index, slice):
@@ -304,6 +333,7 @@ class AnonMap(Map):
     def __setitem__(self, index, value):
         assert not isinstance(index, slice) or len(value) == index.stop - index.start
         index = self._get_offset(index)
+        self._content_digest = None
 
         if issymbolic(value[0]) and isinstance(self._data, bytearray):
             self._data = [
@@ -323,6 +353,11 @@ class AnonMap(Map):
             return [Operators.CHR(i) for i in self._data[index]]
         return Operators.CHR(self._data[index])
 
+    def _concrete_content(self):
+        if isinstance(self._data, bytearray):
+            return self._data
+        return super()._concrete_content()
+
 
 class ArrayMap(Map):
     def __init__(self, address, size, perms, index_bits, backing_array=None, name=None, **kwargs):
@@ -355,6 +390,9 @@ class ArrayMap(Map):
     def __getitem__(self, key):
         return self._array[key]
 
+    def _concrete_content(self):
+        return None
+
     def split(self, address):
         if address <= self.start:
             return None, self
@@ -433,6 +471,7 @@ class FileMap(Map):
     def __setitem__(self, index, value):
         assert not isinstance(index, slice) or len(value) == index.stop - index.start
         index = self._get_offset(index)
+        self._content_digest = None
         if isinstance(index, slice):
             for i in range(index.stop - index.start):
                 self._overlay[index.start + i] = value[i]
@@ -499,6 +538,7 @@ class COWMap(Map):
 
     def __setitem__(self, index, value):
         assert self._in_range(index)
+        self._content_digest = None
         if isinstance(index, slice):
             for i in range(index.stop - index.start):
                 self._cow[index.start + i] = _normalize(value[i])
@@ -1,57 +1,196 @@
-from ..core.smtlib import Z3Solver, ConstraintSet, Operators, issymbolic, BitVec
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Tuple
+from weakref import WeakKeyDictionary
+
+from ..core.smtlib import (
+    Z3Solver,
+    ConstraintSet,
+    Operators,
+    issymbolic,
+    BitVec,
+    translate_to_smtlib,
+)
+from .memory import SMemory
+
+# Results of previous `must_be_true` queries keyed by digests of the SMTLIB text of the constraints and of the
+# expression, least recently used first. Sibling states share most of their path constraints, so the same equality
+# queries recur across merge attempts.
+_MUST_BE_TRUE_CACHE: "OrderedDict[Tuple[bytes, bytes], bool]" = OrderedDict()
+_MUST_BE_TRUE_CACHE_MAX = 4096
+
+# Sizes of the canonical registers, per CPU class
+_SIZEOF_CACHE: "WeakKeyDictionary[type, Dict[str, int]]" = WeakKeyDictionary()
+
+
+def clear_cache():
+    """
+    Drops every cached `must_be_true` result
+    """
+    _MUST_BE_TRUE_CACHE.clear()
+
+
+def cached_must_be_true(session, expr):
+    """
+    Memoized `SolverSession.must_be_true()`. The key is made of digests of the binding-free SMTLIB text of the
+    session constraints and of `expr`, so equal queries hit across separately built constraint sets, while any
+    different constraint yields a different key and stale results are never returned. Once the cache is full, the
+    least recently used result is dropped.
+    :param session: SolverSession over the constraints under which `expr` is checked
+    :param expr: expression that must hold under the session constraints
+    :return: True, if `expr` is true for every model of the session constraints, False otherwise
+    """
+    if not issymbolic(expr):
+        # concrete conditions are decided in Python, without a solver round-trip
+        return bool(expr)
+    expr_digest = hashlib.blake2b(translate_to_smtlib(expr).encode(), digest_size=16).digest()
+    key = (session.fingerprint, expr_digest)
+    result = _MUST_BE_TRUE_CACHE.get(key)
+    if result is None:
+        result = session.must_be_true(expr)
+        if len(_MUST_BE_TRUE_CACHE) >= _MUST_BE_TRUE_CACHE_MAX:
+            _MUST_BE_TRUE_CACHE.popitem(last=False)
+        _MUST_BE_TRUE_CACHE[key] = result
+    else:
+        _MUST_BE_TRUE_CACHE.move_to_end(key)
+    return result
+
+
+def conjunction(terms):
+    """
+    Builds the conjunction of `terms` as a balanced tree of depth log(N), instead of the N deep chain a left fold
+    produces. Concrete terms are folded in Python, so the result is Python False as soon as one term is.
+    :param terms: List of Bool expressions or Python bools
+    :return: the conjunction of the terms, True if there are none
+    """
+    symbolic_terms = []
+    for term in terms:
+        if term is False:
+            return False
+        if term is not True:
+            symbolic_terms.append(term)
+    return _balanced_and(symbolic_terms, 0, len(symbolic_terms))
+
+
+def _balanced_and(terms, start, stop):
+    if stop - start == 0:
+        return True
+    if stop - start == 1:
+        return terms[start]
+    middle = (start + stop) // 2
+    return Operators.AND(_balanced_and(terms, start, middle), _balanced_and(terms, middle, stop))
 
 
 def compare_sockets(cs, socket1, socket2):
     """
     This method compares Socket objects for equality using the buffer and peer attributes.
-    It uses `compare_buffers` for checking buffer attributes for equality.
-    It calls itself for comparing peer Socket objects.
+    It walks both peer chains side by side and checks the equality of all the buffers along them with a single
+    `must_be_true()` call.
     Returns True if the Socket objects are equal, false otherwise.
-    :param cs: ConstraintSet to be used for checking Socket.buffer for semantic equality using `Z3Solver.instance().must_be_true()`
+    :param cs: ConstraintSet to be used for checking Socket.buffer for semantic equality
     :param socket1: one of two Socket objects to be compared for equality against socket2
     :param socket2: one of two Socket objects to be compared for equality against socket1
     :return: True, if the Socket objects are found to be equal, False otherwise
     """
-    if socket1 is None:
-        return socket2 is None
-    if socket2 is None:
-        return socket1 is None
-    if not compare_buffers(cs, socket1.buffer, socket2.buffer):
-        return False
-    return compare_sockets(cs, socket1.peer, socket2.peer)
+    with Z3Solver.instance().incremental(cs) as session:
+        return cached_must_be_true(session, sockets_equality(socket1, socket2))
+
+
+def sockets_equality(socket1, socket2):
+    """
+    Builds the condition under which two Socket objects are equal, walking both peer chains side by side.
+    Connected sockets peer each other, so the walk stops once both chains come back to a pair already compared.
+    :param socket1: one of two Socket objects to be compared for equality against socket2
+    :param socket2: one of two Socket objects to be compared for equality against socket1
+    :return: False if the peer chains differ in length or a buffer differs concretely, otherwise the (possibly
+    symbolic) conjunction of the equalities of all the buffers along the chains
+    """
+    terms = []
+    seen = set()
+    while socket1 is not None or socket2 is not None:
+        if socket1 is None or socket2 is None:
+            return False
+        pair = (id(socket1), id(socket2))
+        if pair in seen:
+            break
+        seen.add(pair)
+        eq = buffers_equality(socket1.buffer, socket2.buffer)
+        if eq is False:
+            return False
+        terms.append(eq)
+        socket1, socket2 = socket1.peer, socket2.peer
+    return conjunction(terms)
 
 
 def compare_buffers(cs, buffer1, buffer2):
     """
-    This method compares the two List objects for equality using the `Z3Solver.instance().must_be_true()` call.
-    :param cs: ConstraintSet to be used for checking buffer1 for semantic equality with buffer2 using `Z3Solver.instance().must_be_true()`
+    This method compares the two List objects for equality using a single `must_be_true()` call on the conjunction
+    of the element-wise equalities.
+    :param cs: ConstraintSet to be used for checking buffer1 for semantic equality with buffer2
     :param buffer1: one of two List objects to be compared for equality against buffer2
     :param buffer2: one of two List objects to be compared for equality against buffer1
     :return: True, if the List objects are equal, False otherwise
     """
+    with Z3Solver.instance().incremental(cs) as session:
+        return cached_must_be_true(session, buffers_equality(buffer1, buffer2))
+
+
+def buffers_equality(buffer1, buffer2):
+    """
+    Builds the condition under which two List objects are equal element-wise. Pairs of concrete elements are
+    compared in Python and never reach the solver.
+    :param buffer1: one of two List objects to be compared for equality against buffer2
+    :param buffer2: one of two List objects to be compared for equality against buffer1
+    :return: False if the buffers differ in length or in a concrete element, otherwise the (possibly symbolic)
+    conjunction of the equalities of the remaining elements
+    """
+    if buffer1 is buffer2:
+        return True
     if len(buffer1) != len(buffer2):
         return False
+    # fully concrete buffers, as most syscall data is, are compared by a single sequence comparison
+    if not any(map(issymbolic, buffer1)) and not any(map(issymbolic, buffer2)):
+        return list(buffer1) == list(buffer2)
+    terms = []
     for b1, b2 in zip(buffer1, buffer2):
-        if not Z3Solver.instance().must_be_true(cs, b1 == b2):
-            return False
-    return True
+        if not issymbolic(b1) and not issymbolic(b2):
+            if b1 != b2:
+                return False
+            continue
+        terms.append(b1 == b2)
+    return conjunction(terms)
 
 
 def merge_constraints(constraints1, constraints2):
     """
+    Sibling states share the constraints of their common ancestor, and (P and A) or (P and B) is P and (A or B), so
+    the constraints found in both sets are kept as they are and only the remaining ones are ORed.
     :param constraints1: one of two ConstraintSet objects to be merged
     :param constraints2: second of two ConstraintSet objects to be merged
     :return: (Expression, Expression, ConstraintSet) where the first and second Expression objects are conjunctions of
-    of all the constraints in constraints1 and constraints2 respectively. The ConstraintSet is an object that contains
-    a single constraint that is a logical OR of these two Expression objects.
-    """
-    exp1 = constraints1.constraints[0]
-    for i in range(1, len(constraints1.constraints)):
-        exp1 = exp1 & constraints1.constraints[i]
-    exp2 = constraints2.constraints[0]
-    for i in range(1, len(constraints2.constraints)):
-        exp2 = exp2 & constraints2.constraints[i]
+    of the constraints only found in constraints1 and constraints2 respectively. The ConstraintSet is an object that
+    contains the shared constraints and a logical OR of these two Expression objects.
+    """
+    # States are unpickled separately, so shared constraints are found by their SMTLIB text rather than identity
+    keys2 = [translate_to_smtlib(c) for c in constraints2.constraints]
+    all_keys2 = set(keys2)
+    shared = []
+    shared_keys = set()
+    own1 = []
+    for c in constraints1.constraints:
+        key = translate_to_smtlib(c)
+        if key in all_keys2:
+            shared.append(c)
+            shared_keys.add(key)
+        else:
+            own1.append(c)
+    own2 = [c for c, key in zip(constraints2.constraints, keys2) if key not in shared_keys]
+
+    exp1 = conjunction(own1)
+    exp2 = conjunction(own2)
     merged_constraint = ConstraintSet()
+    for c in shared:
+        merged_constraint.add(c)
     merged_constraint.add(exp1 | exp2)
     return exp1, exp2, merged_constraint
 
@@ -62,18 +201,51 @@ def compare_byte_vals(mem1, mem2, addr, merged_constraint):
     :param mem1: first of two memory objects we want to use for comparison
     :param mem2: second of two memory objects we want to use for comparison
     :param addr: address at which bytes values are to be compared
-    :param merged_constraint: ConstraintSet to be used when using the call to `Z3Solver.instance().must_be_true()`
+    :param merged_constraint: ConstraintSet to be used when using the call to `must_be_true()`
     :return: returns True if 1 byte values at address `addr` in `mem1` and `mem2` are semantically equal, False otherwise
     """
+    cond = byte_vals_equality(mem1, mem2, addr)
+    if not issymbolic(cond):
+        return cond
+    with Z3Solver.instance().incremental(merged_constraint) as session:
+        return cached_must_be_true(session, cond)
+
+
+def byte_vals_equality(mem1, mem2, addr):
+    """
+    Builds the condition under which the values in memory at address `addr` are equal
+    :param mem1: first of two memory objects we want to use for comparison
+    :param mem2: second of two memory objects we want to use for comparison
+    :param addr: address at which bytes values are to be compared
+    :return: the (possibly symbolic) condition `mem1[addr] == mem2[addr]`
+    """
     val1 = mem1.read(addr, 1)
     val2 = mem2.read(addr, 1)
     # since we only read a single byte value, these lists should only have one entry in them
     assert len(val1) == 1 and len(val2) == 1
-    cond_to_check = val1[0] == val2[0]
-    if not Z3Solver.instance().must_be_true(merged_constraint, cond_to_check):
+    return val1[0] == val2[0]
+
+
+def _sorted_maps(mem):
+    """
+    Returns the maps of a memory object ordered by address. Maps never overlap, so their bounds are enough of a key.
+    """
+    return sorted(mem.maps, key=lambda m: (m.start, m.end))
+
+
+def _maps_metadata_equal(maps1, maps2):
+    """
+    Compares the number of maps of two memory objects, and then their names, permissions, start, and end values
+    :param maps1: maps of one of two memory objects to be compared, as returned by `_sorted_maps`
+    :param maps2: maps of the second of two memory objects to be compared, as returned by `_sorted_maps`
+    :return: True, if the memory objects have the same layout, False otherwise
+    """
+    if len(maps1) != len(maps2):
         return False
-    else:
-        return True
+    for m1, m2 in zip(maps1, maps2):
+        if (m1.start, m1.end, m1.perms, m1.name) != (m2.start, m2.end, m2.perms, m2.name):
+            return False
+    return True
 
 
 # TODO move this comparison into an Executor API that uses an internal State API
@@ -82,54 +254,74 @@ def compare_mem(mem1, mem2, merged_constraint):
     This method compares the number of maps, and then their names, permissions, start, and end values.
     If they all match, then it compares the concrete byte values for equality.
     If those match too, it then compares _symbols attribute values for equality if the two memory objects are of
-    type SMemory.
+    type SMemory. All the symbolic byte comparisons are conjoined and checked with a single solver query.
     :param mem1: one of two memory objects to be compared
     :param mem2: second of two memory objects to be compared
-    :param merged_constraint: ConstraintSet object that is to be used with `Z3Solver.instance().must_be_true()` calls to check the
+    :param merged_constraint: ConstraintSet object that is to be used with `must_be_true()` calls to check the
     memory objects for semantic equality
     :return: True, if the memory objects are equal, False otherwise
     """
-    maps1 = sorted(list(mem1.maps))
-    maps2 = sorted(list(mem2.maps))
-    if len(maps1) != len(maps2):
+    if mem1 is mem2:
+        return True
+    maps1 = _sorted_maps(mem1)
+    maps2 = _sorted_maps(mem2)
+    if not _maps_metadata_equal(maps1, maps2):
         return False
-    ret_val = None
+    cond = mem_equality(mem1, mem2, maps1, maps2)
+    if not issymbolic(cond):
+        return cond
+    with Z3Solver.instance().incremental(merged_constraint) as session:
+        return cached_must_be_true(session, cond)
+
+
+def mem_equality(mem1, mem2, maps1, maps2):
+    """
+    Builds the condition under which two distinct memory objects with the same layout hold the same values. Concrete
+    bytes are compared in Python, only the symbolic ones end up in the returned condition.
+    :param mem1: one of two memory objects to be compared
+    :param mem2: second of two memory objects to be compared, with the same maps as mem1
+    :param maps1: maps of mem1, as returned by `_sorted_maps`
+    :param maps2: maps of mem2, as returned by `_sorted_maps`
+    :return: False if the memory objects differ concretely, otherwise the (possibly symbolic) conjunction of the
+    equalities of their symbolic bytes
+    """
     for m1, m2 in zip(maps1, maps2):
-        if m1 != m2:  # compares the maps' names, permissions, starts, and ends
-            ret_val = False
-            break
-        # Compare concrete byte values in the data in these memory maps for equality
-        bytes1 = m1[m1.start : m1.end]
-        bytes2 = m2[m2.start : m2.end]
-        if bytes1 != bytes2:
-            ret_val = False
-            break
-    checked_addrs = []
+        # maps shared by both memories, as after a fork, hold the same bytes
+        if m1 is m2:
+            continue
+        # Compare concrete byte values in the data in these memory maps for equality, using their cached content
+        # digests when both maps are fully concrete
+        hash1 = m1._content_hash()
+        hash2 = m2._content_hash()
+        if hash1 is not None and hash2 is not None:
+            if hash1 != hash2:
+                return False
+            continue
+        # otherwise compare them a page at a time so a mismatch is found without reading the whole maps
+        for start in range(m1.start, m1.end, mem1.page_size):
+            end = min(start + mem1.page_size, m1.end)
+            if m1[start:end] != m2[start:end]:
+                return False
     # compare symbolic byte values in memory
-    # hack to avoid importing SMemory because that import introduces a circular dependency on ManticoreBase
-    if mem1.__class__.__name__ == "SMemory" and ret_val is not None:
-        for addr1, _ in mem1._symbols.items():
-            checked_addrs.append(addr1)
-            if not compare_byte_vals(mem1, mem2, addr1, merged_constraint):
-                ret_val = False
-                break
-    # hack to avoid importing SMemory because that import introduces a circular dependency on ManticoreBase
-    if mem2.__class__.__name__ == "SMemory" and ret_val is not None:
-        for addr2, _ in mem2._symbols.items():
-            if addr2 not in checked_addrs:
-                if not compare_byte_vals(mem1, mem2, addr2, merged_constraint):
-                    ret_val = False
-                    break
-    if ret_val is not None:
-        return ret_val
-    else:
+    if isinstance(mem1, SMemory) and isinstance(mem2, SMemory) and mem1._symbols is mem2._symbols:
         return True
+    addrs1 = set(mem1._symbols) if isinstance(mem1, SMemory) else set()
+    addrs2 = set(mem2._symbols) if isinstance(mem2, SMemory) else set()
+    terms = []
+    for addr in addrs1 | addrs2:
+        eq = byte_vals_equality(mem1, mem2, addr)
+        if not issymbolic(eq):
+            if not eq:
+                return False
+            continue
+        terms.append(eq)
+    return conjunction(terms)
 
 
 def is_merge_possible(state1, state2, merged_constraint):
     """
     Checks if a merge is possible by checking Input, Output sockets, symbolic_files, syscall_trace, and memory
-    for equality.
+    for equality. All the checks that can be decided in Python run before any solver query.
     :param state1: one of two possible states we want to check for mergeability
     :param state2: second of two possible states we want to check for mergeability
     :param merged_constraint: ConstraintSet of merged constraints for state1 and state2
@@ -138,37 +330,86 @@ def is_merge_possible(state1, state2, merged_constraint):
     platform1 = state1.platform
     platform2 = state2.platform
 
-    ret_val = None
+    # compare symbolic files opened by the two states
+    if platform1.symbolic_files != platform2.symbolic_files:
+        return False, "inequivalent symbolic files"
 
-    # compare input and output sockets of the states
-    if not compare_sockets(
-        merged_constraint, platform1.input, platform2.input
-    ) or not compare_sockets(merged_constraint, platform1.output, platform2.output):
-        ret_val = False, "inequivalent socket operations"
+    # compare system call traces of the two states, leaving their data for later
+    if len(platform1.syscall_trace) != len(platform2.syscall_trace):
+        return False, "inequivalent syscall trace lengths"
+    for (name1, fd1, _), (name2, fd2, _) in zip(platform1.syscall_trace, platform2.syscall_trace):
+        if name1 != name2 or fd1 != fd2:
+            return False, "inequivalent syscall traces"
 
-    # compare symbolic files opened by the two states
-    if ret_val is None and platform1.symbolic_files != platform2.symbolic_files:
-        ret_val = False, "inequivalent symbolic files"
-
-    # compare system call traces of the two states
-    if ret_val is None and len(platform1.syscall_trace) != len(platform2.syscall_trace):
-        ret_val = False, "inequivalent syscall trace lengths"
-    if ret_val is None:
-        for i, (name1, fd1, data1) in enumerate(platform1.syscall_trace):
-            (name2, fd2, data2) = platform2.syscall_trace[i]
-            if not (
-                name1 == name2 and fd1 == fd2 and compare_buffers(merged_constraint, data1, data2)
-            ):
-                ret_val = False, "inequivalent syscall traces"
-                break
-
-    # compare memory of the two states
-    if ret_val is None and not compare_mem(state1.mem, state2.mem, merged_constraint):
-        ret_val = False, "inequivalent memory"
-    if ret_val is not None:
-        return ret_val
-    else:
-        return True, None
+    # compare the memory layouts of the two states, unless they share their memory object
+    same_mem = state1.mem is state2.mem
+    if not same_mem:
+        maps1 = _sorted_maps(state1.mem)
+        maps2 = _sorted_maps(state2.mem)
+        if not _maps_metadata_equal(maps1, maps2):
+            return False, "inequivalent memory"
+
+    # build the equality conditions of the input and output sockets, the syscall data and the memory. These still
+    # reject the merge on peer chain lengths or concrete differences.
+    sockets_cond = conjunction(
+        [
+            sockets_equality(platform1.input, platform2.input),
+            sockets_equality(platform1.output, platform2.output),
+        ]
+    )
+    if sockets_cond is False:
+        return False, "inequivalent socket operations"
+
+    syscall_cond = conjunction(
+        [
+            buffers_equality(data1, data2)
+            for (_, _, data1), (_, _, data2) in zip(
+                platform1.syscall_trace, platform2.syscall_trace
+            )
+        ]
+    )
+    if syscall_cond is False:
+        return False, "inequivalent syscall traces"
+
+    mem_cond = True if same_mem else mem_equality(state1.mem, state2.mem, maps1, maps2)
+    if mem_cond is False:
+        return False, "inequivalent memory"
+
+    # only the symbolic parts are left to the solver, checked together with a single query
+    symbolic_conds = [
+        (cond, reason)
+        for cond, reason in (
+            (sockets_cond, "inequivalent socket operations"),
+            (syscall_cond, "inequivalent syscall traces"),
+            (mem_cond, "inequivalent memory"),
+        )
+        if issymbolic(cond)
+    ]
+    with Z3Solver.instance().incremental(merged_constraint) as session:
+        if not cached_must_be_true(session, conjunction([cond for cond, _ in symbolic_conds])):
+            # find the failing condition in the same session to report it; if none of the others fails, the last
+            # one does, as their conjunction does not hold
+            for cond, reason in symbolic_conds[:-1]:
+                if not cached_must_be_true(session, cond):
+                    return False, reason
+            return False, symbolic_conds[-1][1]
+    return True, None
+
+
+def register_sizes(cpu):
+    """
+    Returns the sizes of the canonical registers of `cpu`. They only depend on the CPU class, so they are computed
+    once per class. The register file class is not enough of a key: I386Cpu and AMD64Cpu share AMD64RegFile but have
+    different canonical registers.
+    :param cpu: CPU object whose register sizes we want
+    :return: Dict mapping each canonical register name to its size in bits
+    """
+    cpu_cls = type(cpu)
+    sizes = _SIZEOF_CACHE.get(cpu_cls)
+    if sizes is None:
+        sizes = {reg: cpu.regfile.sizeof(reg) for reg in cpu.canonical_registers}
+        _SIZEOF_CACHE[cpu_cls] = sizes
+    return sizes
 
 
 def merge_cpu(cpu1, cpu2, state, exp1, merged_constraint):
@@ -178,29 +419,59 @@ def merge_cpu(cpu1, cpu2, state, exp1, merged_constraint):
     :param cpu2: second of two CPU objects that we wish to merge
     :param state: the state whose CPU attribute we will be updating
     :param exp1: the expression that if satisfiable will cause the CPU registers to take corresponding values from
-    `cpu1`, else they will take corresponding values from `cpu2`
+    `cpu1`, else they will take corresponding values from `cpu2`. `merge` passes a selector variable bound to it.
     :param merged_constraint: ConstraintSet under which we would want inequality between CPU register values to be
-    satisfiable as checked using `Z3Solver.instance().must_be_true()`
+    satisfiable as checked using `SolverSession.must_be_true()`
     :return: List of registers that were merged
     """
+    # Decide which registers need an ITE before writing any of them, so every read sees the unmerged values.
+    # Registers holding the same concrete value are skipped: `state` already holds it.
+    to_merge = []
+    read1 = cpu1.read_register
+    read2 = cpu2.read_register
+    with Z3Solver.instance().incremental(merged_constraint) as session:
+        for reg in cpu1.canonical_registers:
+            val1 = read1(reg)
+            val2 = read2(reg)
+            if isinstance(val1, BitVec) and isinstance(val2, BitVec):
+                assert val1.size == val2.size
+            if not issymbolic(val1) and not issymbolic(val2) and val1 == val2:
+                continue
+            if cached_must_be_true(session, val1 != val2):
+                to_merge.append((reg, val1, val2))
+
+    sizes = register_sizes(cpu1)
     merged_regs = []
-    for reg in cpu1.canonical_registers:
-        val1 = cpu1.read_register(reg)
-        val2 = cpu2.read_register(reg)
-        if isinstance(val1, BitVec) and isinstance(val2, BitVec):
-            assert val1.size == val2.size
-        if issymbolic(val1) or issymbolic(val2) or val1 != val2:
-            if Z3Solver.instance().must_be_true(merged_constraint, val1 != val2):
-                merged_regs.append(reg)
-                if cpu1.regfile.sizeof(reg) == 1:
-                    state.cpu.write_register(reg, Operators.ITE(exp1, val1, val2))
-                else:
-                    state.cpu.write_register(
-                        reg, Operators.ITEBV(cpu1.regfile.sizeof(reg), exp1, val1, val2)
-                    )
+    for reg, val1, val2 in to_merge:
+        size = sizes[reg]
+        # flags are Bool values, which Operators.ITEBV does not accept
+        if size == 1:
+            state.cpu.write_register(reg, Operators.ITE(exp1, val1, val2))
+        else:
+            state.cpu.write_register(reg, Operators.ITEBV(size, exp1, val1, val2))
+        merged_regs.append(reg)
     return merged_regs
 
 
+def new_selector(merged_constraint, exp1):
+    """
+    Declares a fresh boolean in `merged_constraint` constrained to be equal to `exp1`
+    :param merged_constraint: ConstraintSet of merged constraints for the two states being merged
+    :param exp1: the condition under which the merged state takes the values of the first state
+    :return: the new BoolVariable
+    """
+    # merged_constraint only declares the variables created in it, so avoid the names its constraints already use
+    taken = {var.name for var in merged_constraint.declarations}
+    name = "merge_sel"
+    suffix = 0
+    while name in taken:
+        suffix += 1
+        name = f"merge_sel_{suffix}"
+    selector = merged_constraint.new_bool(name=name, avoid_collisions=True)
+    merged_constraint.add(selector == exp1)
+    return selector
+
+
 def merge(state1, state2, exp1, merged_constraint):
     """
     Merge state1 and state2 into a single state
@@ -211,7 +482,10 @@ def merge(state1, state2, exp1, merged_constraint):
     :return: the state that is the result of the merging of `state1` and `state2`
     """
     merged_state = state1
-    merged_reg_list = merge_cpu(state1.cpu, state2.cpu, merged_state, exp1, merged_constraint)
+    # Every merged register is an ITE on the same condition. Bind it to a fresh boolean once so the ITEs all refer
+    # to that variable instead of each embedding a copy of `exp1`.
+    selector = new_selector(merged_constraint, exp1)
+    merged_reg_list = merge_cpu(state1.cpu, state2.cpu, merged_state, selector, merged_constraint)
     print("Merged registers: ")
     print(*merged_reg_list, sep=",")
     merged_state.constraints = merged_constraint
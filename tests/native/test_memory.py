@@ -1511,6 +1511,32 @@ class MemoryTest(unittest.TestCase):
         self.assertEqual(m[0x10001000], b"A")
         self.assertEqual(m[0x10002000 - 1], b"Z")
 
+    def test_content_hash(self):
+        m1 = AnonMap(0x10000000, 0x1000, "rwx", "A" * 0x1000)
+        m2 = AnonMap(0x10000000, 0x1000, "rwx", "A" * 0x1000)
+        self.assertEqual(m1._content_hash(), m2._content_hash())
+
+        # A write drops the cached digest
+        m2[0x10000800] = "B"
+        self.assertNotEqual(m1._content_hash(), m2._content_hash())
+
+        cow = COWMap(m1)
+        self.assertEqual(cow._content_hash(), m1._content_hash())
+        cow[0x10000800] = b"B"
+        self.assertEqual(cow._content_hash(), m2._content_hash())
+
+        # Maps holding symbolic bytes have no digest
+        cs = ConstraintSet()
+        m1[0x10000000:0x10000001] = [cs.new_bitvec(8)]
+        self.assertIsNone(m1._content_hash())
+        self.assertIsNone(m1._content_hash())
+
+        # Overwriting the symbolic byte makes the digest computable again
+        m1[0x10000000] = "A"
+        self.assertEqual(
+            m1._content_hash(), AnonMap(0x10000000, 0x1000, "rwx", "A" * 0x1000)._content_hash()
+        )
+
     def test_pickle_mmap_anon(self):
         m = AnonMap(0x10000000, 0x3000, "rwx")
         m[0x10001000] = "A"
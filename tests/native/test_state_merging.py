@@ -0,0 +1,217 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from manticore.core.smtlib import ConstraintSet, Operators, Z3Solver, translate_to_smtlib
+from manticore.native import state_merging
+from manticore.native.cpu.x86 import AMD64Cpu, I386Cpu
+from manticore.native.memory import Memory32, SMemory32, SMemory64
+from manticore.platforms import linux
+
+
+class StateMergingTest(unittest.TestCase):
+    _multiprocess_can_split_ = True
+
+    def setUp(self):
+        self.solver = Z3Solver.instance()
+        state_merging.clear_cache()
+
+    def tearDown(self):
+        state_merging.clear_cache()
+
+    def _constraints(self, *own):
+        cs = ConstraintSet()
+        x = cs.new_bitvec(8, name="X")
+        cs.add(Operators.ULT(x, 0x10))
+        for value in own:
+            cs.add(x == value)
+        return cs, x
+
+    def test_cached_must_be_true_hits_across_constraint_sets(self):
+        cs1, x1 = self._constraints()
+        cs2, x2 = self._constraints()
+
+        with self.solver.incremental(cs1) as session:
+            self.assertTrue(state_merging.cached_must_be_true(session, Operators.ULT(x1, 0x20)))
+
+        # an equal query on a separately built but equal constraint set never reaches the solver
+        with self.solver.incremental(cs2) as session:
+            with mock.patch.object(session, "must_be_true", side_effect=AssertionError):
+                self.assertTrue(
+                    state_merging.cached_must_be_true(session, Operators.ULT(x2, 0x20))
+                )
+
+    def test_cached_must_be_true_evicts_least_recently_used(self):
+        cs, x = self._constraints()
+        queries = [Operators.ULT(x, bound) for bound in (0x20, 0x30, 0x40)]
+
+        with mock.patch.object(state_merging, "_MUST_BE_TRUE_CACHE_MAX", 2):
+            with self.solver.incremental(cs) as session:
+                state_merging.cached_must_be_true(session, queries[0])
+                state_merging.cached_must_be_true(session, queries[1])
+                # a hit makes the first query the most recently used one
+                state_merging.cached_must_be_true(session, queries[0])
+                state_merging.cached_must_be_true(session, queries[2])
+
+                with mock.patch.object(session, "must_be_true", side_effect=AssertionError):
+                    self.assertTrue(state_merging.cached_must_be_true(session, queries[0]))
+                    self.assertTrue(state_merging.cached_must_be_true(session, queries[2]))
+                    with self.assertRaises(AssertionError):
+                        state_merging.cached_must_be_true(session, queries[1])
+
+    def test_sockets_equality_connected_pairs(self):
+        a1, b1 = linux.Socket.pair()
+        a2, b2 = linux.Socket.pair()
+        a1.buffer.extend(b"AB")
+        b1.buffer.extend(b"C")
+        a2.buffer.extend(b"AB")
+        b2.buffer.extend(b"C")
+
+        # the peer chains loop back to the first pair, the walk must still return
+        self.assertIs(state_merging.sockets_equality(a1, a2), True)
+        self.assertTrue(state_merging.compare_sockets(ConstraintSet(), a1, a2))
+
+        b2.buffer[0] = ord("D")
+        self.assertIs(state_merging.sockets_equality(a1, a2), False)
+        self.assertFalse(state_merging.compare_sockets(ConstraintSet(), a1, a2))
+
+    def test_conjunction(self):
+        cs = ConstraintSet()
+        a, b, c, d = (cs.new_bool() for _ in range(4))
+
+        self.assertIs(state_merging.conjunction([]), True)
+        self.assertIs(state_merging.conjunction([True, True]), True)
+        self.assertIs(state_merging.conjunction([a, False, b]), False)
+        self.assertIs(state_merging.conjunction([True, a, True]), a)
+        # the terms are paired into a balanced tree rather than a left-leaning chain
+        result = state_merging.conjunction([a, b, True, c, d])
+        self.assertEqual(result.operands[0].operands, (a, b))
+        self.assertEqual(result.operands[1].operands, (c, d))
+
+    def _memory(self, mem):
+        mem.mmap(0x1000, 0x2000, "rw ")
+        return mem
+
+    def test_mem_equality(self):
+        mem1 = self._memory(Memory32())
+        mem2 = self._memory(Memory32())
+        mem1.write(0x1800, b"AB")
+        mem2.write(0x1800, b"AB")
+        maps1 = state_merging._sorted_maps(mem1)
+        maps2 = state_merging._sorted_maps(mem2)
+        self.assertTrue(state_merging._maps_metadata_equal(maps1, maps2))
+
+        # fully concrete maps are compared by their content digests
+        self.assertIsNotNone(maps1[0]._content_hash())
+        self.assertIs(state_merging.mem_equality(mem1, mem2, maps1, maps2), True)
+        mem2.write(0x1801, b"C")
+        self.assertIs(state_merging.mem_equality(mem1, mem2, maps1, maps2), False)
+        mem2.write(0x1801, b"B")
+
+        # maps holding symbolic bytes have no digest, they are compared a page at a time
+        x = ConstraintSet().new_bitvec(8)
+        mem1.write(0x1000, [x])
+        mem2.write(0x1000, [x])
+        self.assertIsNone(maps1[0]._content_hash())
+        self.assertIs(state_merging.mem_equality(mem1, mem2, maps1, maps2), True)
+        mem2.write(0x2800, b"C")
+        self.assertIs(state_merging.mem_equality(mem1, mem2, maps1, maps2), False)
+
+    def _state(self, mem, input_socket=None, symbolic_files=()):
+        platform = SimpleNamespace(
+            symbolic_files=list(symbolic_files), syscall_trace=[], input=input_socket, output=None
+        )
+        return SimpleNamespace(platform=platform, mem=mem)
+
+    def test_is_merge_possible_concrete(self):
+        cs = ConstraintSet()
+        mem = self._memory(SMemory32(cs))
+        self.assertEqual(
+            state_merging.is_merge_possible(self._state(mem), self._state(mem), cs), (True, None)
+        )
+        self.assertEqual(
+            state_merging.is_merge_possible(
+                self._state(mem), self._state(mem, symbolic_files=["input"]), cs
+            ),
+            (False, "inequivalent symbolic files"),
+        )
+
+        mem1 = self._memory(SMemory32(cs))
+        mem2 = self._memory(SMemory32(cs))
+        mem2.write(0x1000, b"A")
+        self.assertEqual(
+            state_merging.is_merge_possible(self._state(mem1), self._state(mem2), cs),
+            (False, "inequivalent memory"),
+        )
+
+    def test_is_merge_possible_symbolic_reason(self):
+        cs = ConstraintSet()
+        x = cs.new_bitvec(8)
+        y = cs.new_bitvec(8)
+
+        def state(socket_byte, mem_byte):
+            mem = self._memory(SMemory32(cs))
+            mem.write(0x1000, [mem_byte])
+            socket = linux.Socket()
+            socket.buffer.append(socket_byte)
+            return self._state(mem, input_socket=socket)
+
+        # both the sockets and the memory are symbolic, the reason names the one that differs
+        self.assertEqual(
+            state_merging.is_merge_possible(state(x, x), state(x, x), cs), (True, None)
+        )
+        self.assertEqual(
+            state_merging.is_merge_possible(state(x, x), state(x, y), cs),
+            (False, "inequivalent memory"),
+        )
+        self.assertEqual(
+            state_merging.is_merge_possible(state(x, x), state(y, x), cs),
+            (False, "inequivalent socket operations"),
+        )
+
+    def test_merge_constraints_keeps_shared_once(self):
+        cs1, x = self._constraints(1)
+        cs2, _ = self._constraints(2)
+        exp1, exp2, merged = state_merging.merge_constraints(cs1, cs2)
+
+        shared, own1 = cs1.constraints
+        _, own2 = cs2.constraints
+        self.assertEqual(translate_to_smtlib(exp1), translate_to_smtlib(own1))
+        self.assertEqual(translate_to_smtlib(exp2), translate_to_smtlib(own2))
+        texts = [translate_to_smtlib(c) for c in merged.constraints]
+        self.assertEqual(texts.count(translate_to_smtlib(shared)), 1)
+        self.assertEqual(len(texts), 2)
+        self.assertTrue(self.solver.can_be_true(merged, x == 1))
+        self.assertTrue(self.solver.can_be_true(merged, x == 2))
+        self.assertFalse(self.solver.can_be_true(merged, x == 3))
+
+    def test_merge_constraints_subset(self):
+        # every constraint of the first state is shared, so it has none of its own
+        cs1, x = self._constraints()
+        cs2, _ = self._constraints(2)
+        exp1, exp2, merged = state_merging.merge_constraints(cs1, cs2)
+
+        self.assertIs(exp1, True)
+        selector = state_merging.new_selector(merged, exp1)
+        self.assertTrue(self.solver.must_be_true(merged, selector))
+        self.assertTrue(self.solver.can_be_true(merged, x == 3))
+
+    def _merge_cpu(self, cpu_cls, mem_cls, reg):
+        cs = ConstraintSet()
+        cpu1 = cpu_cls(mem_cls(cs))
+        cpu2 = cpu_cls(mem_cls(cs))
+        cpu1.write_register(reg, 1)
+        cpu2.write_register(reg, 2)
+        selector = cs.new_bool(name="sel")
+        merged_regs = state_merging.merge_cpu(cpu1, cpu2, SimpleNamespace(cpu=cpu1), selector, cs)
+
+        self.assertEqual(merged_regs, [reg])
+        value = cpu1.read_register(reg)
+        self.assertTrue(self.solver.must_be_true(cs, Operators.OR(selector, value == 2)))
+        self.assertTrue(self.solver.must_be_true(cs, Operators.OR(~selector, value == 1)))
+
+    def test_merge_cpu_x86(self):
+        # both CPUs use AMD64RegFile but have different canonical registers, merge each after the other
+        self._merge_cpu(I386Cpu, SMemory32, "EAX")
+        self._merge_cpu(AMD64Cpu, SMemory64, "RAX")
+        self._merge_cpu(I386Cpu, SMemory32, "EAX")
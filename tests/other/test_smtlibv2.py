@@ -932,6 +932,37 @@ class ExpressionTest(unittest.TestCase):
         self.assertTrue(solver.must_be_true(cs, Operators.NOT(False)))
         self.assertTrue(solver.must_be_true(cs, Operators.NOT(a == b)))
 
+    def test_incremental_session(self):
+        solver = Z3Solver.instance()
+        cs = ConstraintSet()
+        a = cs.new_bitvec(8)
+        b = cs.new_bitvec(8)
+        cs.add(Operators.ULT(a, 0x10))
+
+        with solver.incremental(cs) as session:
+            self.assertTrue(session.must_be_true(Operators.ULT(a, 0x20)))
+            self.assertFalse(session.must_be_true(a == 0x1))
+            self.assertTrue(session.can_be_true(a == 0x1))
+            self.assertFalse(session.can_be_true(a == 0x10))
+            # variables that do not appear in the constraints get declared on the fly
+            self.assertTrue(session.can_be_true(a == b))
+            self.assertFalse(session.must_be_true(a == b))
+            self.assertTrue(session.must_be_true(True))
+
+            # a query outside the session resets the solver, the session reloads its constraints
+            other = ConstraintSet()
+            c = other.new_bitvec(8)
+            other.add(c == 0x20)
+            self.assertTrue(solver.must_be_true(other, c == 0x20))
+            self.assertFalse(session.can_be_true(a == 0x10))
+            self.assertTrue(session.must_be_true(Operators.ULT(a, 0x10)))
+
+        cs.add(a == 0x10)
+        with solver.incremental(cs) as session:
+            self.assertFalse(session.can_be_true())
+            # anything holds under unsatisfiable constraints
+            self.assertTrue(session.must_be_true(a == 0x11))
+
     def test_check_solver_min(self):
         self.solver._received_version = '(:version "4.4.1")'
         self.assertTrue(self.solver._solver_version() == Version(major=4, minor=4, patch=1))